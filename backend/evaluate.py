@@ -1,12 +1,19 @@
+import re
 import time
-import requests
+import asyncio
+import httpx
 import pandas as pd
 import json
 import logging
 
 # --- Configuration ---
-API_URL = "http://localhost:8000/api/generate-query"
+BASE_URL = "http://localhost:8000"
+API_URL = f"{BASE_URL}/api/generate-query"
+HEALTH_URL = f"{BASE_URL}/health"
 OUTPUT_FILE = "evaluation_results.csv"
+# Number of questions in flight at once, and per-request timeout (the agent may take up to 90s)
+MAX_CONCURRENCY = 10
+REQUEST_TIMEOUT = 120.0
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
@@ -48,26 +55,44 @@ test_cases = [
     }
 ]
 
-def run_evaluation():
+def compile_keywords(keywords):
+    """Builds one case-insensitive pattern matching any of the keywords in a single scan."""
+    # Longest first so overlapping keywords ("East"/"Eastern") resolve to the fuller match
+    alternatives = sorted(keywords, key=len, reverse=True)
+    return re.compile("|".join(re.escape(keyword) for keyword in alternatives), re.IGNORECASE)
+
+async def run_case(client, semaphore, case):
+    """Sends one test question to the API and returns (response, latency)."""
+    async with semaphore:
+        start_time = time.perf_counter_ns()
+        response = await client.post(API_URL, json={"question": case["question"]})
+        return response, (time.perf_counter_ns() - start_time) / 1e9
+
+async def run_evaluation(client):
     results = []
     print(f"🚀 Starting Evaluation on {len(test_cases)} test cases...\n")
 
-    for index, case in enumerate(test_cases):
+    # Fire all questions concurrently so the run takes max(latency) rather than sum(latency)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    suite_start = time.perf_counter_ns()
+    outcomes = await asyncio.gather(
+        *(run_case(client, semaphore, case) for case in test_cases),
+        return_exceptions=True
+    )
+    wall_time = (time.perf_counter_ns() - suite_start) / 1e9
+    keyword_patterns = [compile_keywords(case["expected_keywords"]) for case in test_cases]
+
+    for index, (case, outcome) in enumerate(zip(test_cases, outcomes)):
         question = case["question"]
         expected = case["expected_keywords"]
         category = case["category"]
         
         print(f"[{index+1}/{len(test_cases)}] Testing: {question}")
         
-        start_time = time.time()
-        
         try:
-            # Send request to your FastAPI backend
-            response = requests.post(API_URL, json={"question": question})
-            
-            # Calculate Latency
-            end_time = time.time()
-            latency = end_time - start_time
+            if isinstance(outcome, Exception):
+                raise outcome
+            response, latency = outcome
             
             if response.status_code == 200:
                 data = response.json()
@@ -76,7 +101,7 @@ def run_evaluation():
                 # --- Grading Logic ---
                 # Check if ANY of the expected keywords are in the answer (Case Insensitive)
                 # For a more advanced grade, you could use an LLM here to compare semantics.
-                is_correct = any(keyword.lower() in actual_answer.lower() for keyword in expected)
+                is_correct = keyword_patterns[index].search(actual_answer) is not None
                 
                 status = "✅ PASS" if is_correct else "❌ FAIL"
                 
@@ -124,14 +149,22 @@ def run_evaluation():
     print(f"Correct Answers: {passed_tests}")
     print(f"Accuracy Rate:   {accuracy:.2f}%")
     print(f"Average Latency: {avg_latency:.4f} seconds")
+    print(f"Total Wall Time: {wall_time:.4f} seconds")
     print("="*40)
     print(f"Detailed results saved to: {OUTPUT_FILE}")
 
+async def main():
+    # One pooled client for the whole run: keep-alive connections are reused across
+    # questions instead of paying a TCP (and TLS, for remote APIs) handshake per call.
+    limits = httpx.Limits(max_connections=MAX_CONCURRENCY, max_keepalive_connections=MAX_CONCURRENCY)
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT, limits=limits) as client:
+        # Ensure the API is running before executing; this also warms the first connection
+        await client.get(HEALTH_URL)
+        await run_evaluation(client)
+
 if __name__ == "__main__":
-    # Ensure the API is running before executing
     try:
-        requests.get("http://localhost:8000/health")
-        run_evaluation()
-    except requests.exceptions.ConnectionError:
+        asyncio.run(main())
+    except httpx.ConnectError:
         print("❌ Error: Could not connect to the API.") 
-        print("Please make sure your FastAPI server is running at localhost:8000")
\ No newline at end of file
+        print(f"Please make sure your FastAPI server is running at {BASE_URL}")
@@ -1,8 +1,10 @@
 import os
-import requests
-import time
+import asyncio
+import httpx
+import orjson
 from dotenv import load_dotenv
-from neo4j import GraphDatabase
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+from neo4j import AsyncGraphDatabase
 
 # Load environment variables (prefer values from .env over existing ones)
 load_dotenv(override=True)
@@ -13,52 +15,125 @@ NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
 # Optional: Get free key from balldontlie.io for better limits
 BALLDONTLIE_API_KEY = os.getenv("BALLDONTLIE_API_KEY")
+# Schema cache written by main.py; removed after loading so the API re-reads the schema
+NEO4J_SCHEMA_CACHE = os.getenv("NEO4J_SCHEMA_CACHE", "/tmp/neo4j_schema.json")
 
 # API Endpoints
 API_URL = "https://api.balldontlie.io/v1"
 HEADERS = {"Authorization": BALLDONTLIE_API_KEY} if BALLDONTLIE_API_KEY else {}
 
+# Safety limit for testing (raise this to fetch ALL thousands of players)
+MAX_PLAYER_PAGES = 10
+# Free tier allows 30 req/min; with a key we only cap in-flight requests
+FREE_TIER_REQUESTS_PER_MINUTE = 30
+MAX_CONCURRENT_REQUESTS = 5
+# Concurrent Neo4j writers per page; players are sharded by team so writers never
+# lock the same Team node
+WRITE_SHARDS = 8
+
+
+class RateLimiter:
+    """Spaces out request start times to stay within a requests-per-minute budget."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = asyncio.get_running_loop().time()
+            delay = max(0.0, self.next_slot - now)
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if delay:
+            await asyncio.sleep(delay)
+
+
+# Player fields read by the load_players Cypher; everything else is dropped before sending
+PLAYER_FIELDS = ("id", "first_name", "last_name", "position", "height_feet",
+                 "height_inches", "weight_pounds", "jersey_number")
+
+
+def slim_player(player):
+    """Keeps only the fields the Cypher needs, without nulls (team reduced to its id), plus the full name."""
+    slim = {field: player[field] for field in PLAYER_FIELDS if player.get(field) is not None}
+    # Built here so the Cypher doesn't concatenate strings per row
+    slim["name"] = " ".join(part for part in (player.get("first_name"), player.get("last_name")) if part)
+    if player.get("team"):
+        slim["team"] = {"id": player["team"]["id"]}
+    return slim
+
+
+def is_retryable(exc):
+    """Retry on network errors, rate limiting (429) and server errors."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
 
 class NBAGraphLoader:
     def __init__(self):
-        self.driver = GraphDatabase.driver(
-            NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
+        self.driver = AsyncGraphDatabase.driver(
+            NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD),
+            max_connection_pool_size=100, connection_acquisition_timeout=30)
+        # One keep-alive client for every API call, so pages reuse the TLS connection
+        self.http = httpx.AsyncClient(headers=HEADERS, timeout=30.0)
+
+    async def close(self):
+        await self.http.aclose()
+        await self.driver.close()
 
-    def close(self):
-        self.driver.close()
+    @retry(retry=retry_if_exception(is_retryable), wait=wait_exponential(min=1, max=30),
+           stop=stop_after_attempt(5), reraise=True)
+    async def get_json(self, url):
+        """GETs a balldontlie endpoint and decodes the body, retrying transient failures."""
+        response = await self.http.get(url)
+        response.raise_for_status()
+        return orjson.loads(response.content)
 
-    def setup_schema(self):
+    async def setup_schema(self):
         """Creates indexes to ensure data integrity and faster queries."""
         print("Creating indexes...")
-        with self.driver.session() as session:
+        async with self.driver.session() as session:
             # Create unique constraints for Players and Teams
-            session.run(
+            await session.run(
                 "CREATE CONSTRAINT player_id_unique IF NOT EXISTS FOR (p:Player) REQUIRE p.id IS UNIQUE")
-            session.run(
+            await session.run(
                 "CREATE CONSTRAINT team_id_unique IF NOT EXISTS FOR (t:Team) REQUIRE t.id IS UNIQUE")
+            # Range indexes on the properties the generated Cypher filters on,
+            # so lookups don't fall back to label scans
+            await session.run(
+                "CREATE INDEX player_name IF NOT EXISTS FOR (p:Player) ON (p.name)")
+            await session.run(
+                "CREATE INDEX player_height IF NOT EXISTS FOR (p:Player) ON (p.height_inches)")
+            await session.run(
+                "CREATE INDEX team_name IF NOT EXISTS FOR (t:Team) ON (t.name)")
+            await session.run(
+                "CREATE INDEX team_abbr IF NOT EXISTS FOR (t:Team) ON (t.abbreviation)")
+            await session.run(
+                "CREATE INDEX team_city IF NOT EXISTS FOR (t:Team) ON (t.city)")
             # Create fulltext index for fuzzy search (helps the LLM match names)
             try:
-                session.run(
+                result = await session.run(
                     "CREATE FULLTEXT INDEX playerNames IF NOT EXISTS FOR (n:Player) ON EACH [n.name]")
+                await result.consume()
             except:
                 pass  # Index might already exist
         print("Schema setup complete.")
 
-    def fetch_teams(self):
+    async def fetch_teams(self):
         """Fetches all 30 NBA teams."""
         print("Fetching teams...")
         try:
-            response = requests.get(f"{API_URL}/teams", headers=HEADERS)
-            if response.status_code == 200:
-                return response.json()['data']
-            else:
-                print(f"Error fetching teams: {response.status_code}")
-                return []
+            return (await self.get_json(f"{API_URL}/teams"))['data']
+        except httpx.HTTPStatusError as e:
+            print(f"Error fetching teams: {e.response.status_code}")
+            return []
         except Exception as e:
             print(f"Connection error: {e}")
             return []
 
-    def load_teams(self, teams):
+    async def load_teams(self, teams):
         """Loads teams into Neo4j."""
         query = """
         UNWIND $teams AS team_data
@@ -69,99 +144,163 @@ class NBAGraphLoader:
             t.conference = team_data.conference,
             t.division = team_data.division
         """
-        with self.driver.session() as session:
-            session.run(query, teams=teams)
+        async with self.driver.session() as session:
+            await session.run(query, teams=teams)
         print(f"Successfully loaded {len(teams)} teams.")
 
-    def fetch_players(self):
-        """Fetches players page by page."""
-        print("Fetching players (this may take a moment)...")
-        all_players = []
-        page = 1
-        while True:
-            # Only fetch players per page to save time
-            url = f"{API_URL}/players?per_page=100&page={page}"
+    async def fetch_player_page(self, page, semaphore, limiter):
+        """Fetches a single page of players. Returns the decoded JSON or None on failure."""
+        url = f"{API_URL}/players?per_page=100&page={page}"
+        async with semaphore:
+            if limiter:
+                await limiter.wait()
             try:
-                response = requests.get(url, headers=HEADERS)
-                if response.status_code != 200:
-                    break
+                data = await self.get_json(url)
+                print(f"Fetched page {page}...")
+                return data
+            except httpx.HTTPStatusError as e:
+                print(f"Error fetching page {page}: {e.response.status_code}")
+                return None
+            except Exception as e:
+                print(f"Error fetching players: {e}")
+                return None
 
-                data = response.json()
-                players = data['data']
+    async def iter_player_pages(self):
+        """Yields pages of players: the first page, then the rest as they finish downloading."""
+        print("Fetching players (this may take a moment)...")
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        limiter = RateLimiter(FREE_TIER_REQUESTS_PER_MINUTE) if not BALLDONTLIE_API_KEY else None
 
-                if not players:
-                    break
+        first = await self.fetch_player_page(1, semaphore, limiter)
+        if not first or not first.get('data'):
+            return
+        yield [slim_player(p) for p in first['data']]
 
-                # Filter for active players only if API supports it, otherwise logic handles it
-                # We simply append all fetched players
-                all_players.extend(players)
+        # Use the page count from the response when available, capped by the demo limit
+        total_pages = first.get('meta', {}).get('total_pages') or MAX_PLAYER_PAGES
+        last_page = min(total_pages, MAX_PLAYER_PAGES)
+        if total_pages > MAX_PLAYER_PAGES:
+            print(
+                f"Stopping at {MAX_PLAYER_PAGES} pages for demo purposes. Raise MAX_PLAYER_PAGES to fetch all.")
 
-                print(f"Fetched page {page}...")
-                page += 1
+        # Keep a fixed window of fetches in flight and only start the next one once a
+        # finished page has been handed on, so a slow consumer stops the downloads too
+        pages = iter(range(2, last_page + 1))
+        in_flight = set()
 
-                # Rate limit safety (free tier is 30 req/min)
-                if not BALLDONTLIE_API_KEY:
-                    time.sleep(2)
+        def start_next():
+            page = next(pages, None)
+            if page is not None:
+                in_flight.add(asyncio.create_task(self.fetch_player_page(page, semaphore, limiter)))
 
-                # Safety break for testing (remove this to fetch ALL thousands of players)
-                if page > 10:
-                    print(
-                        "Stopping at 10 pages for demo purposes. Remove limit in code to fetch all.")
-                    break
+        for _ in range(MAX_CONCURRENT_REQUESTS):
+            start_next()
+        try:
+            while in_flight:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    data = task.result()
+                    if data and data['data']:
+                        yield [slim_player(p) for p in data['data']]
+                    start_next()
+        finally:
+            for task in in_flight:
+                task.cancel()
 
-            except Exception as e:
-                print(f"Error fetching players: {e}")
-                break
+    async def fetch_and_load_players(self, teams_loaded=None):
+        """Writes each page to Neo4j while the next pages are still downloading.
 
-        return all_players
+        If given, `teams_loaded` is awaited before the first write so that the
+        PLAYS_FOR relationships can find their Team nodes.
+        """
+        # Bounded so a slow database keeps at most a few pages in memory
+        queue = asyncio.Queue(maxsize=4)
 
-    def load_players(self, players):
+        async def producer():
+            async for players in self.iter_player_pages():
+                await queue.put(players)
+            await queue.put(None)
+
+        async def consumer():
+            if teams_loaded:
+                await teams_loaded
+            loaded = 0
+            while (players := await queue.get()) is not None:
+                await self.load_players(players)
+                loaded += len(players)
+            return loaded
+
+        _, loaded = await asyncio.gather(producer(), consumer())
+        print(f"Successfully loaded {loaded} players.")
+
+    async def load_players(self, players):
         """Loads players and connects them to their teams."""
-        # Cypher query to create Player and relationship to Team
+        # Cypher query to create Player and relationship to Team. The server commits
+        # every 1000 rows itself, so each list goes over in a single call.
         query = """
         UNWIND $players AS p
-        MERGE (player:Player {id: p.id})
-        SET player.name = p.first_name + ' ' + p.last_name,
-            player.first_name = p.first_name,
-            player.last_name = p.last_name,
-            player.position = p.position,
-            player.height = CASE WHEN p.height_feet IS NOT NULL THEN p.height_feet + "'" + p.height_inches + '"' ELSE null END,
-            player.weight = p.weight_pounds,
-            player.jersey_number = p.jersey_number
-            player.team = p.team_idy
-
-        WITH player, p
-        WHERE p.team IS NOT NULL
-        MATCH (t:Team {id: p.team.id})
-        MERGE (player)-[:PLAYS_FOR]->(t)
+        CALL {
+            WITH p
+            MERGE (player:Player {id: p.id})
+            SET player.name = p.name,
+                player.first_name = p.first_name,
+                player.last_name = p.last_name,
+                player.position = p.position,
+                player.height_inches = CASE WHEN p.height_feet IS NOT NULL THEN toInteger(p.height_feet) * 12 + coalesce(toInteger(p.height_inches), 0) ELSE null END,
+                player.weight = p.weight_pounds,
+                player.jersey_number = p.jersey_number
+            // Height used to be stored as a display string
+            REMOVE player.height
+
+            WITH player, p
+            WHERE p.team IS NOT NULL
+            MATCH (t:Team {id: p.team.id})
+            MERGE (player)-[:PLAYS_FOR]->(t)
+        } IN TRANSACTIONS OF 1000 ROWS
         """
 
-        # Batch processing to prevent memory overload
-        batch_size = 500
-        with self.driver.session() as session:
-            for i in range(0, len(players), batch_size):
-                batch = players[i:i+batch_size]
-                session.run(query, players=batch)
-                print(f"Processed batch {i} to {i+len(batch)}")
+        # Shard by team id: each shard gets its own session and they write in parallel.
+        # Within a shard, group players by team so each transaction touches few Team nodes.
+        shards = [[] for _ in range(WRITE_SHARDS)]
+        for p in players:
+            team_id = (p.get('team') or {}).get('id') or 0
+            shards[team_id % WRITE_SHARDS].append(p)
 
-        print(f"Successfully loaded {len(players)} players.")
+        async def write_shard(shard):
+            shard.sort(key=lambda p: (p.get('team') or {}).get('id') or 0)
+            # CALL { ... } IN TRANSACTIONS needs an auto-commit transaction, i.e. session.run
+            async with self.driver.session() as session:
+                result = await session.run(query, players=shard)
+                await result.consume()
 
+        await asyncio.gather(*(write_shard(shard) for shard in shards if shard))
 
-if __name__ == "__main__":
+        print(f"Loaded batch of {len(players)} players.")
+
+
+async def main():
     loader = NBAGraphLoader()
     try:
-        loader.setup_schema()
+        await loader.setup_schema()
 
         # 1. Load Teams
-        teams = loader.fetch_teams()
-        if teams:
-            loader.load_teams(teams)
+        teams = await loader.fetch_teams()
+        teams_loaded = asyncio.create_task(loader.load_teams(teams)) if teams else None
+
+        # 2. Load Players (streamed page by page; downloads overlap the team load)
+        await loader.fetch_and_load_players(teams_loaded)
 
-        # 2. Load Players
-        players = loader.fetch_active_players()
-        if players:
-            loader.load_players(players)
+        # 3. Invalidate the API's cached schema so it picks up the new data model
+        try:
+            os.remove(NEO4J_SCHEMA_CACHE)
+            print(f"Removed schema cache {NEO4J_SCHEMA_CACHE}.")
+        except FileNotFoundError:
+            pass
 
     finally:
-        loader.close()
+        await loader.close()
         print("Database population finished.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())